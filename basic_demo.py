@@ -1,6 +1,8 @@
+import atexit
 from graphmemory import GraphMemory, Node
 
 graph_db = GraphMemory(database='graph.db')
+atexit.register(graph_db.conn.close)
 
 def add_node():
     name = input("Enter node name: ")
@@ -10,9 +12,9 @@ def add_node():
     print(f"Node added with ID: {node_id}")
 
 def find_node(name):
-    result = graph_db.cypher(f"MATCH (n) WHERE n.name = '{name}' RETURN n")
+    result = graph_db.nodes_by_attribute("name", name)
     if result:
-        node = result[0]['n']
+        node = result[0]
         print(f"Node found: {node.properties}")
     else:
         print(f"No node found with name: {name}")
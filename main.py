@@ -1,35 +1,160 @@
+import asyncio
+import atexit
+import functools
+import hashlib
 import json
 import os
-from dotenv import load_dotenv
+import sys
+from collections import OrderedDict
+import numpy as np
 from graphmemory import GraphMemory, Node, Edge
-from openai import OpenAI
+from similarity_cache import clear_similarity_cache, lookup_similar_query, store_similar_query
 
-# Load environment variables
-load_dotenv()
+# Skip the "Press Enter" pauses when not attached to a terminal or when DEMO_NONINTERACTIVE is set
+INTERACTIVE = sys.stdin.isatty() and not os.environ.get("DEMO_NONINTERACTIVE")
 
-# Set up the OpenAI client
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+# OpenAI client for embeddings, created on first use
+_client = None
+
+# OpenAI models and the fixed parts of the attribute extraction request
+_MODEL_CHAT = "gpt-4o-mini"
+_MODEL_EMBED = "text-embedding-3-small"
+_SYSTEM_MSG = {"role": "system", "content": "Extract structured data from this text using the following attributes: name, title, country, term_start, term_end. Return the result as a JSON object."}
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "PersonAttrs",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "title": {"type": "string"},
+                "country": {"type": "string"},
+                "term_start": {"type": "string"},
+                "term_end": {"type": "string"}
+            },
+            "required": ["name", "title", "country", "term_start", "term_end"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Fingerprint of the prompt and schema, so editing either invalidates cached attributes
+_ATTRIBUTE_REQUEST_HASH = hashlib.sha256(json.dumps([_SYSTEM_MSG, _RESPONSE_FORMAT], sort_keys=True).encode()).hexdigest()
+
+# Maximum number of attribute extraction requests in flight at once
+MAX_CONCURRENT_EXTRACTIONS = 5
+
+# On-disk caches for OpenAI results, keyed by the SHA-256 of the input text
+ATTRIBUTE_CACHE_DIR = '.attr_cache'
+EMBEDDING_CACHE_DIR = '.embedding_cache'
+
+# In-process LRU embedding cache keyed by (model, text), so repeated texts within a run skip the disk cache too
+EMBEDDING_MEMO_SIZE = 1024
+_embedding_memo = OrderedDict()
 
 # Initialize the GraphMemory database
 graph_db = GraphMemory(database='graph.db', vector_length=1536)
+atexit.register(graph_db.conn.close)
+
+def pause(message):
+    """Wait for the user to press Enter, unless running non-interactively."""
+    if INTERACTIVE:
+        input(message)
+
+def _load_api_key():
+    from dotenv import load_dotenv
+    load_dotenv()
+    return os.environ["OPENAI_API_KEY"]
+
+def _get_client():
+    """Return the OpenAI client, importing the SDK and loading the API key on first use."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=_load_api_key())
+    return _client
+
+
+def _cache_path(directory, text, extension=".json"):
+    return os.path.join(directory, hashlib.sha256(text.encode()).hexdigest() + extension)
+
+def _write_cache_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+def load_cached(directory, text):
+    """Return the cached result for a text, or None if it is not cached or the cache file is unreadable."""
+    path = _cache_path(directory, text)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def store_cached(directory, text, value):
+    """Write a JSON-serializable result for a text to the cache directory."""
+    _write_cache_file(_cache_path(directory, text), json.dumps(value).encode())
+
+def _embedding_cache_path(text):
+    return _cache_path(EMBEDDING_CACHE_DIR, f"{_MODEL_EMBED}\0{text}", ".f32")
 
-def extract_attributes(text):
+def load_cached_embedding(text):
+    """Return the cached embedding for a text as a list of floats, or None if it has not been cached yet."""
+    path = _embedding_cache_path(text)
+    if not os.path.exists(path):
+        return None
+    return np.fromfile(path, dtype=np.float32).tolist()
+
+def store_cached_embedding(text, embedding):
+    """Write an embedding to the cache directory as a packed float32 blob."""
+    _write_cache_file(_embedding_cache_path(text), np.asarray(embedding, dtype=np.float32).tobytes())
+
+def disk_cache(directory, namespace=""):
+    """Cache the result of an async function of a text on disk, keyed by the SHA-256 of namespace and text."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(text, *args, **kwargs):
+            key = f"{namespace}\0{text}"
+            cached = load_cached(directory, key)
+            if cached is not None:
+                return cached
+            result = await func(text, *args, **kwargs)
+            store_cached(directory, key, result)
+            return result
+        return wrapper
+    return decorator
+
+@disk_cache(ATTRIBUTE_CACHE_DIR, namespace=f"{_MODEL_CHAT}\0{_ATTRIBUTE_REQUEST_HASH}")
+async def request_attributes(text, client):
+    """Ask OpenAI's GPT model for the attributes of a text as schema-validated JSON.
+
+    Raises ValueError if the model refuses or its reply is cut off, so nothing is cached.
+    """
+    response = await client.chat.completions.create(
+        model=_MODEL_CHAT,
+        messages=[_SYSTEM_MSG, {"role": "user", "content": text}],
+        response_format=_RESPONSE_FORMAT
+    )
+    choice = response.choices[0]
+    if choice.message.refusal:
+        raise ValueError(f"Model refused to extract attributes: {choice.message.refusal}")
+    if choice.finish_reason == "length" or choice.message.content is None:
+        raise ValueError(f"Model returned no complete result (finish_reason: {choice.finish_reason})")
+    return json.loads(choice.message.content)
+
+async def extract_attributes(text, client):
     """Extract structured data from unstructured text using OpenAI's GPT model."""
     print(f"\nExtracting attributes from: '{text}'")
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "Extract structured data from this text using the following attributes: name, title, country, term_start, term_end. Return the result as a JSON object."},
-            {"role": "user", "content": text}
-        ]
-    )
-    
     try:
-        attributes = json.loads(response.choices[0].message.content)
-        print(f"Extracted attributes: {attributes}")
-        return attributes
-    except json.JSONDecodeError:
-        print("Failed to parse API response as JSON. Returning default structure.")
+        attributes = await request_attributes(text, client)
+    except ValueError as e:
+        print(f"{e}. Returning default structure.")
         return {
             "name": "Unknown",
             "title": "Unknown",
@@ -37,39 +162,96 @@ def extract_attributes(text):
             "term_start": "Unknown",
             "term_end": "Unknown"
         }
+    print(f"Extracted attributes: {attributes}")
+    return attributes
+
+async def extract_all(texts):
+    """Extract attributes for several texts concurrently, bounded to respect rate limits.
+
+    The AsyncOpenAI client is created and closed here, since its connection pool is bound to the running event loop.
+    """
+    from openai import AsyncOpenAI
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_EXTRACTIONS)
+
+    async with AsyncOpenAI(api_key=_load_api_key()) as client:
+        async def bounded_extract(text):
+            async with semaphore:
+                return await extract_attributes(text, client)
+
+        return await asyncio.gather(*[bounded_extract(text) for text in texts])
+
+def calculate_embeddings_batch(texts):
+    """Calculate embeddings for several inputs, sending every uncached text in a single OpenAI API request."""
+    if not texts:
+        return []
+    misses = []
+    for text in dict.fromkeys(texts):
+        key = (_MODEL_EMBED, text)
+        if key in _embedding_memo:
+            _embedding_memo.move_to_end(key)
+            continue
+        embedding = load_cached_embedding(text)
+        if embedding is None:
+            misses.append(text)
+        else:
+            _embedding_memo[key] = embedding
+    print(f"\nCalculating embeddings for {len(misses)} text(s) ({len(texts) - len(misses)} cached or repeated)")
+    if misses:
+        response = _get_client().embeddings.create(
+            input=misses,
+            model=_MODEL_EMBED
+        )
+        for text, d in zip(misses, response.data):
+            _embedding_memo[(_MODEL_EMBED, text)] = d.embedding
+            store_cached_embedding(text, d.embedding)
+    embeddings = [list(_embedding_memo[(_MODEL_EMBED, text)]) for text in texts]
+    while len(_embedding_memo) > EMBEDDING_MEMO_SIZE:
+        _embedding_memo.popitem(last=False)
+    print(f"Embeddings calculated. Vector length: {len(embeddings[0])}")
+    return embeddings
 
 def calculate_embedding(input_text):
     """Calculate embedding for a given input using OpenAI's API."""
     print(f"\nCalculating embedding for: '{input_text}'")
-    response = client.embeddings.create(
-        input=input_text,
-        model="text-embedding-3-small"
+    return calculate_embeddings_batch([input_text])[0]
+
+async def prepare_nodes(texts):
+    """Extract attributes and calculate embeddings for texts, overlapping the two API phases."""
+    return await asyncio.gather(
+        extract_all(texts),
+        asyncio.to_thread(calculate_embeddings_batch, texts)
     )
-    print(f"Embedding calculated. Vector length: {len(response.data[0].embedding)}")
-    return response.data[0].embedding
-
-def create_node(text):
-    """Create a node with attributes extracted from text and embedding."""
-    print(f"\nCreating node for: '{text}'")
-    attributes = extract_attributes(text)
-    embedding = calculate_embedding(text)
-    node = Node(properties=attributes, vector=embedding)
-    node_id = graph_db.insert_node(node)
-    print(f"Node created with ID: {node_id}")
-    return node_id
-
-def create_edge(source_id, target_id, relation, weight):
-    """Create an edge between two nodes."""
-    print(f"\nCreating edge: {source_id} -{relation}-> {target_id} (weight: {weight})")
-    edge = Edge(source_id=source_id, target_id=target_id, relation=relation, weight=weight)
-    graph_db.insert_edge(edge)
-    print("Edge created successfully")
+
+def create_nodes(texts, attrs_list, embeddings):
+    """Create nodes from preextracted attributes and precomputed embeddings in a single transaction."""
+    print(f"\nCreating {len(texts)} node(s)")
+    nodes = [Node(properties=attributes, vector=embedding) for attributes, embedding in zip(attrs_list, embeddings)]
+    inserted = graph_db.bulk_insert_nodes(nodes)
+    clear_similarity_cache()
+    node_ids = [node.id for node in inserted]
+    for text, node_id in zip(texts, node_ids):
+        print(f"Node created with ID: {node_id} for: '{text}'")
+    return node_ids
+
+def create_edges(relationships):
+    """Create edges from (source_id, target_id, relation, weight) tuples in a single transaction."""
+    edges = []
+    for source_id, target_id, relation, weight in relationships:
+        print(f"\nCreating edge: {source_id} -{relation}-> {target_id} (weight: {weight})")
+        edges.append(Edge(source_id=source_id, target_id=target_id, relation=relation, weight=weight))
+    graph_db.bulk_insert_edges(edges)
+    print(f"{len(edges)} edge(s) created successfully")
 
 def query_nearest_nodes(query_text, limit=1):
-    """Find nearest nodes by vector embedding."""
+    """Find nearest nodes by vector embedding, reusing results for near-duplicate queries."""
     print(f"\nQuerying nearest nodes for: '{query_text}'")
     query_embedding = calculate_embedding(query_text)
+    nearest_nodes = lookup_similar_query(query_embedding, limit)
+    if nearest_nodes is not None:
+        print(f"Found {len(nearest_nodes)} nearest node(s) in similarity cache")
+        return nearest_nodes
     nearest_nodes = graph_db.nearest_nodes(query_embedding, limit=limit)
+    store_similar_query(query_embedding, limit, nearest_nodes)
     print(f"Found {len(nearest_nodes)} nearest node(s)")
     return nearest_nodes
 
@@ -96,7 +278,7 @@ def run_cypher_query(query):
 def main():
     print("Starting Graph Database Demo")
     print("============================")
-    input("Press Enter to start the demo...")
+    pause("Press Enter to start the demo...")
 
     # Sample unstructured texts
     texts = [
@@ -108,64 +290,67 @@ def main():
 
     print("\n\n=== Step 1: Creating nodes from unstructured text ===")
     print("This step will create nodes in the graph database from the given unstructured text.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
-    node_ids = [create_node(text) for text in texts]
+    attrs_list, embeddings = asyncio.run(prepare_nodes(texts))
+    node_ids = create_nodes(texts, attrs_list, embeddings)
 
     print("\nNodes created:")
     for node_id in node_ids:
         node = graph_db.get_node(node_id)
         print(f"Node {node_id}: {node.properties}")
     
-    input("\nPress Enter to proceed to the next step...")
+    pause("\nPress Enter to proceed to the next step...")
 
     print("\n\n=== Step 2: Creating relationships between nodes ===")
     print("This step will create edges (relationships) between the nodes we just created.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
-    create_edge(node_ids[0], node_ids[1], "succeeded_by", 1.0)  # Washington -> Jefferson
-    create_edge(node_ids[0], node_ids[2], "appointed", 0.8)     # Washington -> Hamilton
-    create_edge(node_ids[0], node_ids[3], "succeeded_by", 1.0)  # Washington -> Adams
-    create_edge(node_ids[3], node_ids[1], "succeeded_by", 1.0)  # Adams -> Jefferson
+    create_edges([
+        (node_ids[0], node_ids[1], "succeeded_by", 1.0),  # Washington -> Jefferson
+        (node_ids[0], node_ids[2], "appointed", 0.8),     # Washington -> Hamilton
+        (node_ids[0], node_ids[3], "succeeded_by", 1.0),  # Washington -> Adams
+        (node_ids[3], node_ids[1], "succeeded_by", 1.0),  # Adams -> Jefferson
+    ])
 
     print("\nEdges created:")
     print(graph_db.edges_to_json())
     
-    input("\nPress Enter to proceed to the next step...")
+    pause("\nPress Enter to proceed to the next step...")
 
     print("\n\n=== Step 3: Demonstrating vector similarity search ===")
     print("This step will demonstrate how to find the nearest node to a given query using vector similarity.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
     nearest_nodes = query_nearest_nodes("Who was the first President of the United States?", limit=1)
     print(f"Nearest node: {nearest_nodes[0].node.properties}")
     print(f"Distance: {nearest_nodes[0].distance}")
     
-    input("\nPress Enter to proceed to the next step...")
+    pause("\nPress Enter to proceed to the next step...")
 
     print("\n\n=== Step 4: Querying nodes by attribute ===")
     print("This step will demonstrate how to find nodes by a specific attribute.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
     presidents = query_nodes_by_attribute("title", "President of the United States")
     for node in presidents:
         print(f"President: {node.properties.get('name', 'Unknown')}, Served: {node.properties.get('term_start', 'Unknown')} to {node.properties.get('term_end', 'Unknown')}")
     
-    input("\nPress Enter to proceed to the next step...")
+    pause("\nPress Enter to proceed to the next step...")
 
     print("\n\n=== Step 5: Demonstrating edge deletion ===")
     print("This step will demonstrate how to delete an edge between two nodes.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
     delete_edge(node_ids[0], node_ids[1])  # Delete Washington -> Jefferson edge
     print("\nEdges after deletion:")
     print(graph_db.edges_to_json())
     
-    input("\nPress Enter to proceed to the final step...")
+    pause("\nPress Enter to proceed to the final step...")
 
     print("\n\n=== Step 6: Running a Cypher query ===")
     print("This step will demonstrate how to run a Cypher query on the graph database.")
-    input("Press Enter to continue...")
+    pause("Press Enter to continue...")
 
     cypher_query = "MATCH (n:Person) WHERE n.title CONTAINS 'Secretary' RETURN n.name, n.title"
     result = run_cypher_query(cypher_query)
@@ -174,7 +359,7 @@ def main():
         print(f"{record.get('n.name', 'Unknown')} - {record.get('n.title', 'Unknown')}")
 
     print("\nGraph Database Demo Completed")
-    input("Press Enter to exit...")
+    pause("Press Enter to exit...")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,72 @@
+"""Similarity cache for nearest-node queries.
+
+A query whose embedding is within SIMILARITY_CACHE_THRESHOLD cosine distance of a
+cached query reuses that query's nearest nodes, rescored against the new query,
+instead of searching the graph again.
+"""
+from collections import OrderedDict
+import numpy as np
+
+SIMILARITY_CACHE_CAPACITY = 128
+SIMILARITY_CACHE_THRESHOLD = 0.05
+
+_similarity_cache = OrderedDict()
+_similarity_index = None
+
+def _normalize(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+def _quantize(vector):
+    """Quantize a normalized vector to int8 bytes for use as a cache key."""
+    return np.round(vector * 127).clip(-127, 127).astype(np.int8).tobytes()
+
+def _get_similarity_index():
+    """Return the cached query keys, their stacked (N, d) vectors and limits, rebuilding after changes."""
+    global _similarity_index
+    if _similarity_index is None:
+        keys = list(_similarity_cache)
+        vectors = np.stack([_similarity_cache[key][0] for key in keys])
+        limits = np.array([_similarity_cache[key][1] for key in keys])
+        _similarity_index = (keys, vectors, limits)
+    return _similarity_index
+
+def _rescore_nearest_nodes(nearest_nodes, query_embedding):
+    """Recompute L2 distances of cached nearest nodes against a new query, closest first."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    rescored = [
+        type(n)(node=n.node, distance=float(np.linalg.norm(np.asarray(n.node.vector, dtype=np.float32) - query)))
+        for n in nearest_nodes
+    ]
+    return sorted(rescored, key=lambda n: n.distance)
+
+def clear_similarity_cache():
+    """Drop every cached nearest-node query."""
+    global _similarity_index
+    _similarity_cache.clear()
+    _similarity_index = None
+
+def lookup_similar_query(query_embedding, limit, threshold=SIMILARITY_CACHE_THRESHOLD):
+    """Return the nearest nodes of the closest cached query within threshold, rescored for this query, or None."""
+    if not _similarity_cache:
+        return None
+    keys, vectors, limits = _get_similarity_index()
+    distances = 1.0 - vectors @ _normalize(query_embedding)
+    distances[limits < limit] = np.inf
+    best = int(np.argmin(distances))
+    if distances[best] > threshold:
+        return None
+    _similarity_cache.move_to_end(keys[best])
+    return _rescore_nearest_nodes(_similarity_cache[keys[best]][2], query_embedding)[:limit]
+
+def store_similar_query(query_embedding, limit, nearest_nodes):
+    """Cache nearest nodes for a query, evicting the least recently used entry when full."""
+    global _similarity_index
+    _similarity_index = None
+    query_vector = _normalize(query_embedding)
+    key = _quantize(query_vector)
+    _similarity_cache[key] = (query_vector, limit, nearest_nodes)
+    _similarity_cache.move_to_end(key)
+    if len(_similarity_cache) > SIMILARITY_CACHE_CAPACITY:
+        _similarity_cache.popitem(last=False)
@@ -0,0 +1,50 @@
+from collections import namedtuple
+
+import pytest
+
+from similarity_cache import clear_similarity_cache, lookup_similar_query, store_similar_query
+
+# Stand-ins for graphmemory's Node and NearestNode
+Node = namedtuple("Node", ["name", "vector"])
+NearestNode = namedtuple("NearestNode", ["node", "distance"])
+
+OLD_QUERY = [10.0, 0.0]
+NEW_QUERY = [10.0, 1.0]
+NODE_A = Node("a", [10.0, -1.0])
+NODE_B = Node("b", [10.0, 1.8])
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_similarity_cache()
+    yield
+    clear_similarity_cache()
+
+
+def test_hit_is_reranked_for_the_new_query_before_slicing():
+    # Ordered for OLD_QUERY: a is at distance 1.0, b at 1.8
+    store_similar_query(OLD_QUERY, 2, [NearestNode(NODE_A, 1.0), NearestNode(NODE_B, 1.8)])
+
+    result = lookup_similar_query(NEW_QUERY, 1)
+
+    assert [n.node.name for n in result] == ["b"]
+    assert result[0].distance == pytest.approx(0.8)
+
+
+def test_distant_query_misses():
+    store_similar_query(OLD_QUERY, 2, [NearestNode(NODE_A, 1.0)])
+
+    assert lookup_similar_query([0.0, 10.0], 1) is None
+
+
+def test_entry_with_smaller_limit_misses():
+    store_similar_query(OLD_QUERY, 1, [NearestNode(NODE_A, 1.0)])
+
+    assert lookup_similar_query(OLD_QUERY, 2) is None
+
+
+def test_clear_drops_cached_queries():
+    store_similar_query(OLD_QUERY, 1, [NearestNode(NODE_A, 1.0)])
+    clear_similarity_cache()
+
+    assert lookup_similar_query(OLD_QUERY, 1) is None